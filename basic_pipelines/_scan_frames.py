@@ -0,0 +1,76 @@
+"""
+Numba-compiled radar frame scanner for bulk serial reads.
+
+numba is optional: when it is not installed ``scan_frames`` is None and
+RadarHandler keeps decoding with its pure-Python frame parser.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+KIND_PRIMARY = 0  # 0xFC 0xFA ss 0x00
+KIND_LEADING = 1  # 0xFB 0xFD ss 0x00
+
+
+def _scan(buf):
+    """
+    Walk a uint8 buffer and pick out every complete 4-byte radar frame.
+
+    Frames are a known header followed by the speed byte and a trailing 0x00;
+    anything else is skipped one byte at a time.
+
+    Args:
+        buf: Contiguous uint8 array (e.g. np.frombuffer over the rx bytearray)
+
+    Returns:
+        (speeds, kinds, consumed): raw speed bytes and KIND_* values in stream
+        order, and the number of leading bytes that can be dropped from buf
+    """
+    n_max = buf.shape[0] // 4
+    speeds = np.empty(n_max, np.uint8)
+    kinds = np.empty(n_max, np.uint8)
+    n = 0
+    i = 0
+    while i <= buf.shape[0] - 4:
+        if buf[i+3] == 0x00:
+            b0 = buf[i]
+            b1 = buf[i+1]
+            if b0 == 0xFC and b1 == 0xFA:
+                speeds[n] = buf[i+2]
+                kinds[n] = KIND_PRIMARY
+                n += 1
+                i += 4
+                continue
+            if b0 == 0xFB and b1 == 0xFD:
+                speeds[n] = buf[i+2]
+                kinds[n] = KIND_LEADING
+                n += 1
+                i += 4
+                continue
+        i += 1
+    return speeds[:n], kinds[:n], i
+
+
+scan_frames = njit(cache=True, nogil=True)(_scan) if njit is not None else None
+
+
+def _scan_buffer(data):
+    """
+    Run scan_frames over a bytes-like object (e.g. the rx bytearray).
+
+    Returns:
+        (speeds, kinds, consumed) as plain Python lists / int
+    """
+    view = np.frombuffer(data, dtype=np.uint8)
+    try:
+        speeds, kinds, consumed = scan_frames(view)
+    finally:
+        # Drop the buffer export so a bytearray can be resized by the caller
+        del view
+    return speeds.tolist(), kinds.tolist(), int(consumed)
+
+
+scan_buffer = _scan_buffer if scan_frames is not None else None
@@ -1,4 +1,6 @@
 import os
+import json
+import logging
 import cv2
 import numpy as np
 import base64
@@ -6,6 +8,13 @@ from collections import deque
 from shapely.geometry import Point, Polygon
 from typing import List, Tuple, Dict, Any, Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
 
 def setup_logging():
     """No-op function - logging is completely disabled."""
@@ -64,6 +73,53 @@ def encode_frame_to_bytes(image: np.ndarray, quality: int = 95) -> bytes:
     return buffer.tobytes()
 
 
+def recompress_jpeg_bytes(data: bytes, quality: int = 85) -> bytes:
+    """
+    Re-encode JPEG bytes at a lower quality with optimized Huffman tables.
+    
+    Args:
+        data: Encoded JPEG bytes
+        quality: Target JPEG quality (1-100)
+        
+    Returns:
+        Re-encoded bytes, or the original bytes if decoding fails or the result is not smaller
+    """
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return data
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality, int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+    ok, buffer = cv2.imencode('.jpg', image, encode_param)
+    if not ok or buffer.size >= len(data):
+        return data
+    return buffer.tobytes()
+
+
+def serialize_kafka_value(value: Any) -> bytes:
+    """
+    Kafka value_serializer: orjson when installed (numpy-aware, returns bytes), else stdlib json.
+    
+    Args:
+        value: JSON-serializable message payload
+        
+    Returns:
+        UTF-8 encoded JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value).encode("utf-8")
+
+
+def log_kafka_send_failure(topic: str, exc: Exception) -> None:
+    """
+    Errback for asynchronous producer sends; add_errback passes bound args before the exception.
+    
+    Args:
+        topic: Topic the message was sent to
+        exc: Delivery exception raised by the producer
+    """
+    logger.warning("Kafka delivery to %s failed: %s", topic, exc)
+
+
 def is_vehicle_in_zone(anchor_point: Tuple[float, float], zone_polygon: Polygon) -> bool:
     """
     Check if the center of the vehicle's bounding box is inside a zone.
@@ -1,28 +1,88 @@
 import io
-import json
+import logging
 import time
 import uuid
 import queue
 import threading
 import signal
+import socket
 import sys
 from datetime import datetime
 from kafka import KafkaProducer
 from kafka.errors import KafkaError, NoBrokersAvailable
 from typing import Optional, Dict, Any, List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import boto3
 from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.args import ClientArgsCreator
 from video_clipper import VideoClipRecorder
+from helper_utils import recompress_jpeg_bytes, serialize_kafka_value, log_kafka_send_failure
 
-# S3 Transfer configuration
+logger = logging.getLogger(__name__)
+
+# S3 Transfer configuration (only used for payloads at or above the multipart threshold;
+# smaller ones go through a single PutObject)
 S3_TRANSFER_CONFIG = TransferConfig(
     multipart_threshold=5 * 1024 * 1024,  # 5MB
     multipart_chunksize=5 * 1024 * 1024,
-    max_concurrency=4
+    max_concurrency=4,
+    use_threads=True
+)
+
+# Camera snapshots above this size are re-encoded before upload to save bandwidth
+SNAPSHOT_RECOMPRESS_THRESHOLD = 200 * 1024  # 200KB
+SNAPSHOT_JPEG_QUALITY = 85
+
+# S3 client configuration: pooled keep-alive connections and short timeouts.
+# Single attempt per call (total_max_attempts counts the first try; max_attempts
+# would add a retry on top); retries/failover are handled by upload_to_s3.
+S3_CLIENT_CONFIG = Config(
+    signature_version="s3v4",
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={"total_max_attempts": 1, "mode": "standard"},
+)
+
+# Aggressive keep-alive probes so NAT/NLB idle timeouts (~350s) don't silently
+# drop pooled S3 connections between bursts
+S3_TCP_KEEPALIVE_OPTIONS = (
+    ("TCP_KEEPIDLE", 60),
+    ("TCP_KEEPINTVL", 10),
+    ("TCP_KEEPCNT", 3),
 )
 
+
+def _install_s3_keepalive_socket_options():
+    """Extend the socket options botocore builds for new clients with keep-alive timers when tcp_keepalive is on."""
+    original = getattr(ClientArgsCreator, "_compute_socket_options", None)
+    if original is None:
+        # Hook moved in this botocore version; clients still get plain SO_KEEPALIVE
+        logger.warning("botocore has no ClientArgsCreator._compute_socket_options; S3 keep-alive timers not applied")
+        return
+    if getattr(original, "_svds_keepalive", False):
+        return
+
+    def _compute_socket_options(self, scoped_config, client_config=None):
+        socket_options = original(self, scoped_config, client_config)
+        if (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in socket_options:
+            for name, value in S3_TCP_KEEPALIVE_OPTIONS:
+                # Not every platform exposes all TCP keep-alive knobs
+                if hasattr(socket, name):
+                    socket_options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+        return socket_options
+
+    _compute_socket_options._svds_keepalive = True
+    ClientArgsCreator._compute_socket_options = _compute_socket_options
+
+
+_install_s3_keepalive_socket_options()
+
+# Shared boto3 session so every S3 client reuses one credential/endpoint resolver
+_BOTO3_SESSION = boto3.session.Session()
+
 class KafkaHandler:
     """Resilient Kafka + S3 handler with continuous operation and async uploads."""
 
@@ -35,30 +95,47 @@ class KafkaHandler:
         self._stop_event = threading.Event()
         self._shutdown_requested = False
 
-        # Flush settings
+        # Flush settings: sends are batched by the producer (linger_ms/batch_size);
+        # an explicit flush only happens every flush_interval seconds and on close
         self.last_flush_time = time.time()
-        self.messages_since_flush = 0
         self.flush_interval = 5
-        self.flush_threshold = 10
+        self.send_batch_size = 64  # Max queued messages drained per wake-up
 
-        # Kafka brokers
+        # Kafka brokers (failover between them is handled by the producer itself)
         self.brokers = self._get_broker_list()
-        self.current_broker_index = 0
-        self.broker_health = {b: True for b in self.brokers}
+        # The producer is only recycled after repeated send failures within a window
+        self.max_send_failures_per_window = 5
+        self.send_failure_window = 60
+        self._windowed_send_failures = 0
+        self._first_send_failure_time = 0.0
+        # A failed broker batch fails every record in it with the same exception;
+        # remember the last one so the batch is counted once
+        self._last_send_failure_exc = None
+        # Bumped on recycle so errbacks from a closed producer are not counted against its successor
+        self._producer_generation = 0
+        # Failures are counted from the producer's I/O thread (errback) and the loop thread
+        self._send_failure_lock = threading.Lock()
 
         # S3 configs
         self.s3_configs = self._get_s3_configs()
-        self.current_s3_index = 0
         self.s3_health = {name: True for name in self.s3_configs.keys()}
-
-        # Health check
+        self._upload_retries = int(self.config.get("kafka_variables", {}).get("AWS_S3", {}).get("upload_retries", 3))
+        # Per-bucket (client, bucket_name, key prefix by file type, public URL prefix), filled by _setup_aws_s3
+        self._s3_upload_meta: Dict[str, Tuple[Any, str, Dict[str, str], str]] = {}
+        # Dedicated pool for racing uploads across buckets (kept separate from
+        # self.executor, whose workers block on these futures). An event fans out
+        # to one upload per payload type (image, snapshot, video) per bucket.
+        self.s3_executor = ThreadPoolExecutor(max_workers=3 * max(1, len(self.s3_configs)))
+
+        # Passive health tracking: a failed bucket is retried optimistically once
+        # health_check_interval seconds have passed since its last failure
         self.health_check_interval = int(self.config.get("kafka_variables", {}).get("health_check_interval", 15))
-        self._health_thread = None
+        self.s3_last_failure = {name: 0.0 for name in self.s3_configs.keys()}
 
         # Setup AWS S3 and Video Recorder
         self._setup_aws_s3()
         self._setup_video_recorder()
-        self._start_health_monitor()
+        self.kafka_pipeline = self._create_kafka_producer(max_attempts=1)
         self._setup_signal_handlers()
 
     # ------------------------- Setup helpers -------------------------
@@ -90,15 +167,23 @@ class KafkaHandler:
     def _setup_aws_s3(self):
         for name, config in self.s3_configs.items():
             try:
-                client = boto3.client(
+                client = _BOTO3_SESSION.client(
                     "s3",
                     aws_access_key_id=config.get("aws_access_key_id"),
                     aws_secret_access_key=config.get("aws_secret_access_key"),
                     region_name=config.get("region_name"),
                     endpoint_url=f"http://{config.get('end_point_url')}" if config.get("end_point_url") else None,
-                    config=Config(signature_version="s3v4")
+                    config=S3_CLIENT_CONFIG
                 )
                 self.s3_clients[name] = client
+                key_prefixes = {
+                    "video": config.get("video_fn", ""),
+                    "image": config.get("org_img_fn", ""),
+                    "snapshot": config.get("cgi_fn", ""),
+                }
+                # URL prefix is built once here; the upload path only appends the object key
+                url_prefix = f"http://{config.get('end_point_url')}/{config.get('BUCKET_NAME')}/"
+                self._s3_upload_meta[name] = (client, config.get("BUCKET_NAME"), key_prefixes, url_prefix)
                 print(f"DEBUG: Initialized S3 client for {name}: {config.get('BUCKET_NAME')}")
             except Exception as e:
                 print(f"DEBUG: Failed to init S3 client {name}: {e}")
@@ -122,75 +207,38 @@ class KafkaHandler:
         signal.signal(signal.SIGTERM, signal_handler)
 
     # ------------------------- Health monitoring -------------------------
-    def _test_s3_connectivity(self, s3_name: str) -> bool:
-        try:
-            client = self.s3_clients.get(s3_name)
-            if not client:
-                return False
-            bucket_name = self.s3_configs[s3_name].get("BUCKET_NAME")
-            client.list_objects_v2(Bucket=bucket_name, MaxKeys=1)
-            return True
-        except Exception:
-            return False
-
-    def _test_broker_connectivity(self, broker: str) -> bool:
-        try:
-            test_producer = KafkaProducer(bootstrap_servers=str(broker), request_timeout_ms=3000, max_block_ms=2000)
-            test_producer.close()
-            return True
-        except Exception:
-            return False
+    def _mark_s3_unhealthy(self, s3_name: str):
+        self.s3_health[s3_name] = False
+        self.s3_last_failure[s3_name] = time.time()
 
-    def _start_health_monitor(self):
-        def monitor():
-            while not self._stop_event.is_set():
-                try:
-                    for broker in self.brokers:
-                        if not self.broker_health.get(broker, False):
-                            healthy = self._test_broker_connectivity(broker)
-                            self.broker_health[broker] = healthy
-                            if healthy:
-                                print(f"DEBUG: Broker recovered: {broker}")
-                    
-                    for s3_name in self.s3_configs.keys():
-                        if not self.s3_health.get(s3_name, False):
-                            healthy = self._test_s3_connectivity(s3_name)
-                            self.s3_health[s3_name] = healthy
-                            if healthy:
-                                print(f"DEBUG: S3 recovered: {s3_name}")
-                except Exception as e:
-                    print(f"DEBUG: Health monitor error: {e}")
-                time.sleep(self.health_check_interval)
-        
-        self._health_thread = threading.Thread(target=monitor, daemon=True)
-        self._health_thread.start()
+    def _refresh_s3_health(self):
+        """Optimistically re-enable buckets whose cooldown has expired; the next real upload reveals their health."""
+        current_time = time.time()
+        for s3_name, ok in self.s3_health.items():
+            if not ok and current_time - self.s3_last_failure.get(s3_name, 0.0) > self.health_check_interval:
+                self.s3_health[s3_name] = True
 
     # ------------------------- Kafka helpers -------------------------
-    def _get_next_healthy_broker(self) -> Optional[str]:
-        healthy = [b for b, ok in self.broker_health.items() if ok]
-        if not healthy:
-            return None
-        broker = healthy[self.current_broker_index % len(healthy)]
-        self.current_broker_index += 1
-        return broker
-
     def _create_kafka_producer(self, max_attempts=3) -> Optional[KafkaProducer]:
+        """Create one long-lived producer bootstrapped with every broker.
+
+        kafka-python fails over between the bootstrap brokers and reconnects
+        on its own, so the producer is kept for the lifetime of the handler.
+        """
         attempt = 0
         backoff = 1
         while attempt < max_attempts and not self._stop_event.is_set():
-            broker = self._get_next_healthy_broker()
-            if not broker and self.brokers:
-                broker = self.brokers[self.current_broker_index % len(self.brokers)]
-            if not broker:
-                return None
             try:
                 kafka_config = self.config.get("kafka_variables", {})
                 producer = KafkaProducer(
-                    bootstrap_servers=str(broker),
-                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    bootstrap_servers=self.brokers,
+                    value_serializer=serialize_kafka_value,
                     acks="all",
                     retries=5,
                     retry_backoff_ms=500,
+                    reconnect_backoff_ms=50,
+                    reconnect_backoff_max_ms=2000,
+                    metadata_max_age_ms=30000,
                     compression_type="gzip",
                     batch_size=int(kafka_config.get("batch_size", 512 * 1024)),
                     buffer_memory=67108864,
@@ -199,12 +247,10 @@ class KafkaHandler:
                     max_block_ms=5000,
                     linger_ms=int(kafka_config.get("linger_ms", 50))
                 )
-                _ = producer.metrics()
-                print(f"DEBUG: Connected to broker: {broker}")
+                print(f"DEBUG: Kafka producer bootstrapped with brokers: {self.brokers}")
                 return producer
             except Exception as e:
-                print(f"DEBUG: Failed to create Kafka producer with broker {broker}: {e}")
-                self.broker_health[broker] = False
+                print(f"DEBUG: Failed to create Kafka producer with brokers {self.brokers}: {e}")
                 time.sleep(backoff)
                 backoff = min(backoff * 2, 10)
                 attempt += 1
@@ -219,108 +265,130 @@ class KafkaHandler:
             return True
         return False
 
-    def _handle_broker_failure(self):
+    def _record_send_failure(self, exc=None, generation=None):
+        """
+        Count a send failure within the current window. Only counts; safe to call from the errback.
+
+        Args:
+            exc: Delivery exception from the errback; records sharing it belong to one failed batch
+            generation: Producer generation the record was sent on (None for loop-thread failures)
+        """
+        now = time.time()
+        with self._send_failure_lock:
+            if generation is not None and generation != self._producer_generation:
+                return
+            if exc is not None:
+                if exc is self._last_send_failure_exc:
+                    return
+                self._last_send_failure_exc = exc
+            if self._windowed_send_failures == 0 or now - self._first_send_failure_time > self.send_failure_window:
+                self._windowed_send_failures = 0
+                self._first_send_failure_time = now
+            self._windowed_send_failures += 1
+
+    def _recycle_producer_if_failing(self):
+        """Loop thread only: close the producer after repeated failures within the window."""
+        with self._send_failure_lock:
+            failures = self._windowed_send_failures
+            if failures < self.max_send_failures_per_window:
+                return
+            self._windowed_send_failures = 0
+            self._last_send_failure_exc = None
+            self._producer_generation += 1
+
+        logger.warning("%d Kafka send failures in %ss, recycling producer", failures, self.send_failure_window)
         if self.kafka_pipeline:
             try:
-                self.kafka_pipeline.close()
+                self.kafka_pipeline.close(timeout=5)
             except Exception:
                 pass
             finally:
                 self.kafka_pipeline = None
-        self.kafka_pipeline = self._create_kafka_producer()
 
     # ------------------------- S3 upload helpers -------------------------
-    def _get_next_healthy_s3(self) -> Optional[str]:
-        healthy = [name for name, ok in self.s3_health.items() if ok]
-        if not healthy:
+    def _single_upload(self, s3_name: str, file_bytes: bytes, file_type: str, unique_filename: str) -> Optional[str]:
+        """Upload to one bucket with retries; returns the object URL or None."""
+        meta = self._s3_upload_meta.get(s3_name)
+        if not meta:
+            self._mark_s3_unhealthy(s3_name)
             return None
-        name = healthy[self.current_s3_index % len(healthy)]
-        self.current_s3_index += 1
-        return name
+        client, bucket_name, key_prefixes, url_prefix = meta
 
-    def upload_to_s3(self, file_bytes: bytes, file_type: str = "image") -> Optional[str]:
-        """Upload file to S3 with retries and failover"""
-        if not file_bytes:
-            return None
-
-        upload_retries = int(self.config.get("kafka_variables", {}).get("AWS_S3", {}).get("upload_retries", 3))
-        tried = set()
+        content_type = ("video/mp4" if file_type == "video" else "image/jpg")
+        key = f"{key_prefixes.get(file_type, key_prefixes['snapshot'])}{unique_filename}"
 
-        # Try healthy S3 buckets first
-        for _ in range(max(1, len(self.s3_configs))):
-            s3_name = self._get_next_healthy_s3()
-            if not s3_name or s3_name in tried:
+        for attempt in range(self._upload_retries):
+            if self._stop_event.is_set():
                 break
-            tried.add(s3_name)
-            
-            client = self.s3_clients.get(s3_name)
-            config = self.s3_configs.get(s3_name)
-            if not client or not config:
-                self.s3_health[s3_name] = False
-                continue
-
-            unique_filename = (f"clips{uuid.uuid4()}.mp4" if file_type == "video" else f"{uuid.uuid4()}.jpg")
-            content_type = ("video/mp4" if file_type == "video" else "image/jpg")
-
-            for attempt in range(upload_retries):
-                try:
-                    if file_type == "video":
-                        client.upload_fileobj(
-                            io.BytesIO(file_bytes),
-                            Bucket=config.get("BUCKET_NAME"),
-                            Key=f"{config.get('video_fn', '')}{unique_filename}",
-                            ExtraArgs={"ContentType": content_type},
-                            Config=S3_TRANSFER_CONFIG,
-                        )
-                        url = f"http://{config.get('end_point_url')}/{config.get('BUCKET_NAME')}/{config.get('video_fn', '')}{unique_filename}"
-                        return url
-                    else:
-                        key_prefix = config.get('org_img_fn', '') if file_type == "image" else config.get('cgi_fn', '')
-                        client.put_object(
-                            Bucket=config.get("BUCKET_NAME"),
-                            Key=f"{key_prefix}{unique_filename}",
-                            Body=file_bytes,
-                            ContentType=content_type,
-                        )
-                        url = f"http://{config.get('end_point_url')}/{config.get('BUCKET_NAME')}/{key_prefix}{unique_filename}"
-                        return url
-                except Exception as e:
-                    print(f"DEBUG: S3 {file_type} upload attempt {attempt + 1} to {s3_name} failed: {e}")
-                    time.sleep(0.5 * (attempt + 1))
-            
-            # Mark as unhealthy after retries
-            self.s3_health[s3_name] = False
-
-        # Last-ditch attempt with any S3 bucket
-        for name, config in self.s3_configs.items():
-            if name in tried:
-                continue
-            client = self.s3_clients.get(name)
             try:
-                unique_filename = (f"clips{uuid.uuid4()}.mp4" if file_type == "video" else f"{uuid.uuid4()}.jpg")
-                content_type = ("video/mp4" if file_type == "video" else "image/jpg")
-                
-                if file_type == "video":
+                # Large payloads use the multipart transfer manager; in-memory clips
+                # below the threshold are sent as one PutObject without a BytesIO wrapper
+                if len(file_bytes) >= S3_TRANSFER_CONFIG.multipart_threshold:
                     client.upload_fileobj(
                         io.BytesIO(file_bytes),
-                        Bucket=config.get("BUCKET_NAME"),
-                        Key=f"{config.get('video_fn', '')}{unique_filename}",
+                        Bucket=bucket_name,
+                        Key=key,
                         ExtraArgs={"ContentType": content_type},
-                        Config=S3_TRANSFER_CONFIG
+                        Config=S3_TRANSFER_CONFIG,
                     )
-                    return f"http://{config.get('end_point_url')}/{config.get('BUCKET_NAME')}/{config.get('video_fn', '')}{unique_filename}"
                 else:
-                    key_prefix = config.get('org_img_fn', '') if file_type == "image" else config.get('cgi_fn', '')
                     client.put_object(
-                        Bucket=config.get("BUCKET_NAME"),
-                        Key=f"{key_prefix}{unique_filename}",
+                        Bucket=bucket_name,
+                        Key=key,
                         Body=file_bytes,
-                        ContentType=content_type
+                        ContentType=content_type,
                     )
-                    return f"http://{config.get('end_point_url')}/{config.get('BUCKET_NAME')}/{key_prefix}{unique_filename}"
+                return url_prefix + key
+            except Exception as e:
+                logger.warning("S3 %s upload attempt %d to %s failed: %s", file_type, attempt + 1, s3_name, e)
+                time.sleep(0.5 * (attempt + 1))
+
+        # Mark as unhealthy after retries
+        self._mark_s3_unhealthy(s3_name)
+        return None
+
+    def upload_to_s3(self, file_bytes: bytes, file_type: str = "image") -> Optional[str]:
+        """Race the upload across all healthy S3 buckets and return the first URL that succeeds."""
+        if not file_bytes:
+            return None
+
+        unique_filename = (f"clips{uuid.uuid4()}.mp4" if file_type == "video" else f"{uuid.uuid4()}.jpg")
+
+        # Raw camera snapshots are often high-quality full-resolution JPEGs
+        if file_type == "snapshot" and len(file_bytes) > SNAPSHOT_RECOMPRESS_THRESHOLD:
+            try:
+                file_bytes = recompress_jpeg_bytes(file_bytes, SNAPSHOT_JPEG_QUALITY)
             except Exception as e:
-                print(f"DEBUG: Last-ditch upload to {name} failed: {e}")
-                continue
+                logger.warning("Snapshot recompression failed, uploading original: %s", e)
+
+        # Prefer healthy buckets; if none are healthy, last-ditch attempt with all of them
+        self._refresh_s3_health()
+        targets = [name for name, ok in self.s3_health.items() if ok and name in self._s3_upload_meta]
+        if not targets:
+            targets = list(self._s3_upload_meta.keys())
+        if not targets:
+            return None
+
+        pending = {
+            self.s3_executor.submit(self._single_upload, name, file_bytes, file_type, unique_filename): name
+            for name in targets
+        }
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = pending.pop(fut)
+                    try:
+                        url = fut.result()
+                    except Exception as e:
+                        logger.warning("S3 %s upload to %s failed: %s", file_type, name, e)
+                        url = None
+                    if url:
+                        return url
+        finally:
+            # Cancel losers that have not started yet; running ones finish in the background
+            for fut in pending:
+                fut.cancel()
 
         return None
 
@@ -330,23 +398,21 @@ class KafkaHandler:
             if file_bytes:
                 return self.upload_to_s3(file_bytes, file_type)
         except Exception as e:
-            print(f"DEBUG: S3 upload failed for {file_type}: {e}")
+            logger.error("S3 upload failed for %s: %s", file_type, e)
         return None
 
     # ------------------------- Flush helpers -------------------------
     def _smart_flush(self):
         if not self.kafka_pipeline:
             return
-        self.messages_since_flush += 1
         current_time = time.time()
-        if self.messages_since_flush >= self.flush_threshold or (current_time - self.last_flush_time) >= self.flush_interval:
+        if (current_time - self.last_flush_time) >= self.flush_interval:
             try:
                 self.kafka_pipeline.flush(timeout=5)
             except Exception as e:
-                print(f"DEBUG: Smart flush failed: {e}")
+                logger.warning("Smart flush failed: %s", e)
             finally:
                 self.last_flush_time = time.time()
-                self.messages_since_flush = 0
 
     def _force_flush(self):
         if self.kafka_pipeline:
@@ -356,62 +422,85 @@ class KafkaHandler:
                 print(f"DEBUG: Force flush failed: {e}")
             finally:
                 self.last_flush_time = time.time()
-                self.messages_since_flush = 0
 
-    # ------------------------- Queue processing -------------------------
-    def process_events_queue(self, events_queue: queue.Queue, topic: str) -> bool:
-        try:
-            message = events_queue.get(timeout=1)
-            if message is None or topic == "None":
-                return True
+    def _on_send_failure(self, topic: str, generation: int, exc):
+        """Log a failed delivery and count it toward the producer recycle gate."""
+        log_kafka_send_failure(topic, exc)
+        self._record_send_failure(exc, generation)
 
-            image_bytes = message.get("org_img")
-            snap_shot_bytes = message.get("snap_shot")
-            video_bytes = message.get("video")
+    # ------------------------- Queue processing -------------------------
+    def _drain_batch(self, q: queue.Queue, timeout: float) -> List[Dict[str, Any]]:
+        """Block for the first message, then take whatever else is already queued (up to send_batch_size)."""
+        messages = [q.get(timeout=timeout)]
+        while len(messages) < self.send_batch_size:
+            try:
+                messages.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return [m for m in messages if m is not None]
+
+    def _process_event(self, message: Dict[str, Any], topic: str) -> bool:
+        image_bytes = message.get("org_img")
+        snap_shot_bytes = message.get("snap_shot")
+        video_bytes = message.get("video")
+
+        uploads = {}
+        futures = {
+            self.executor.submit(self.upload_to_s3_safe, image_bytes, "image"): "org_img",
+            self.executor.submit(self.upload_to_s3_safe, snap_shot_bytes, "snapshot"): "snap_shot",
+            self.executor.submit(self.upload_to_s3_safe, video_bytes, "video"): "video"
+        }
+
+        for fut in as_completed(futures):
+            key = futures[fut]
+            try:
+                uploads[key] = fut.result()
+            except Exception as e:
+                logger.error("Upload task failed for %s: %s", key, e)
+                uploads[key] = None
 
-            uploads = {}
-            futures = {
-                self.executor.submit(self.upload_to_s3_safe, image_bytes, "image"): "org_img",
-                self.executor.submit(self.upload_to_s3_safe, snap_shot_bytes, "snapshot"): "snap_shot",
-                self.executor.submit(self.upload_to_s3_safe, video_bytes, "video"): "video"
-            }
+        message["org_img"] = uploads.get("org_img")
+        message["snap_shot"] = uploads.get("snap_shot")
+        message["video"] = uploads.get("video")
 
-            for fut in as_completed(futures):
-                key = futures[fut]
-                try:
-                    uploads[key] = fut.result()
-                except Exception as e:
-                    print(f"DEBUG: Upload task failed for {key}: {e}")
-                    uploads[key] = None
+        if message["org_img"] is None:
+            logger.warning("Insufficient uploads, message skipped")
+            return False
+        if not self._ensure_kafka_pipeline():
+            logger.warning("Kafka pipeline unavailable, skipping message")
+            return False
+        try:
+            # Fire-and-forget: delivery errors surface through the errback
+            self.kafka_pipeline.send(topic, message).add_errback(
+                self._on_send_failure, topic, self._producer_generation)
+            return True
+        except (KafkaError, NoBrokersAvailable) as e:
+            # The producer reconnects internally; only recycle it on repeated failures
+            logger.warning("Kafka send error: %s", e)
+            self._record_send_failure()
+            return False
+        except Exception as e:
+            logger.error("Kafka send failed: %s", e)
+            return False
 
-            message["org_img"] = uploads.get("org_img")
-            message["snap_shot"] = uploads.get("snap_shot")
-            message["video"] = uploads.get("video")
+    def process_events_queue(self, events_queue: queue.Queue, topic: str, timeout: float = 0.5) -> bool:
+        """Drain a batch of events, upload their media and send them as one producer burst."""
+        try:
+            messages = self._drain_batch(events_queue, timeout)
+            if not messages or topic == "None":
+                return True
 
-            if message["org_img"] is not None:
-                if not self._ensure_kafka_pipeline():
-                    print("DEBUG: Kafka pipeline unavailable, skipping message")
-                    return False
-                try:
-                    future = self.kafka_pipeline.send(topic, message)
-                    record_metadata = future.get(timeout=10)
-                    self._smart_flush()
-                    #print(f"DEBUG: Message sent to partition {record_metadata.partition} offset {record_metadata.offset}")
-                    return True
-                except (KafkaError, NoBrokersAvailable):
-                    self._handle_broker_failure()
-                    return False
-                except Exception as e:
-                    print(f"DEBUG: Kafka send failed: {e}")
-                    return False
-            else:
-                print("DEBUG: Insufficient uploads, message skipped")
-                return False
+            ok = True
+            for message in messages:
+                ok = self._process_event(message, topic) and ok
+            # One (time-gated) flush per batch so the sends above coalesce
+            self._smart_flush()
+            return ok
 
         except queue.Empty:
             return True
         except Exception as e:
-            print(f"DEBUG: Events queue processing error: {e}")
+            logger.error("Events queue processing error: %s", e)
             return False
 
     # ------------------------- Main loop -------------------------
@@ -419,8 +508,6 @@ class KafkaHandler:
         """Main Kafka processing loop - runs indefinitely until shutdown is requested"""
         kafka_config = self.config.get("kafka_variables", {})
         send_events_pipeline = kafka_config.get("send_events_pipeline")
-        queues_and_topics = [(events_queue, send_events_pipeline)]
-        consecutive_empty_cycles = 0
         retry_sleep = 1
 
         print(f"DEBUG: Starting continuous Kafka loop with brokers: {self.brokers}")
@@ -428,29 +515,22 @@ class KafkaHandler:
 
         while not self._stop_event.is_set():
             try:
+                self._recycle_producer_if_failing()
                 if not self._ensure_kafka_pipeline():
                     time.sleep(retry_sleep)
                     retry_sleep = min(retry_sleep * 2, 10)
                     continue
                 retry_sleep = 1
 
-                messages_processed = 0
-                for queue_obj, topic in queues_and_topics:
-                    if self.process_events_queue(queue_obj, topic):
-                        messages_processed += 1
-
-                if messages_processed == 0:
-                    consecutive_empty_cycles += 1
-                    time.sleep(min(0.5 * consecutive_empty_cycles, 5))
-                else:
-                    consecutive_empty_cycles = 0
-                    time.sleep(0.01)
+                # Blocks in queue.get() until an event arrives (or the timeout
+                # elapses so the stop event is re-checked); no idle back-off.
+                self.process_events_queue(events_queue, send_events_pipeline)
             except (KafkaError, NoBrokersAvailable) as e:
-                print(f"DEBUG: Kafka connection error in main loop: {e}")
-                self._handle_broker_failure()
+                logger.warning("Kafka connection error in main loop: %s", e)
+                self._record_send_failure()
                 time.sleep(1)
             except Exception as e:
-                print(f"DEBUG: Unexpected error in Kafka loop: {e}")
+                logger.error("Unexpected error in Kafka loop: %s", e)
                 time.sleep(1)
 
         print("DEBUG: Kafka loop stopped due to shutdown request")
@@ -462,15 +542,13 @@ class KafkaHandler:
         self._stop_event.set()
         
         try:
-            # Wait for health monitor thread to finish
-            if self._health_thread and self._health_thread.is_alive():
-                self._health_thread.join(timeout=5)
-                print("DEBUG: Health monitor thread stopped")
-
             # Shutdown thread pool executor properly - NO TIMEOUT
             if hasattr(self, 'executor'):
                 self.executor.shutdown(wait=True)
                 print("DEBUG: ThreadPoolExecutor closed")
+            if hasattr(self, 's3_executor'):
+                self.s3_executor.shutdown(wait=True)
+                print("DEBUG: S3 upload executor closed")
 
             # Close Kafka producer
             if self.kafka_pipeline:
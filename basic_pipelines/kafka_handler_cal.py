@@ -1,17 +1,19 @@
 import io
-import json
+import logging
 import time
 import uuid
 import queue
 import boto3
-from datetime import datetime
 from kafka import KafkaProducer
 from kafka.errors import KafkaError, NoBrokersAvailable
 from typing import Optional, Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from video_clipper import VideoClipRecorder
 from boto3.s3.transfer import TransferConfig
 from botocore.client import Config 
+from helper_utils import serialize_kafka_value, log_kafka_send_failure
+
+logger = logging.getLogger(__name__)
 
 # S3 Transfer configuration for multipart uploads (used for video files)
 S3_TRANSFER_CONFIG = TransferConfig(
@@ -39,11 +41,10 @@ class KafkaHandler:
         self.error_interval = 300
         self.executor = ThreadPoolExecutor(max_workers=3)
         
-        # Flush tracking for smart flushing
+        # Flush tracking (see _smart_flush)
         self.last_flush_time = time.time()
-        self.messages_since_flush = 0
-        self.flush_interval = 20  # Flush every 5 seconds
-        self.flush_threshold = 10  # Or after 10 messages
+        self.flush_interval = 20  # Flush every 20 seconds
+        self.send_batch_size = 64  # Max queued messages drained per wake-up
         
         # Dual broker redundancy settings
         self.brokers = self._get_broker_list()
@@ -51,6 +52,11 @@ class KafkaHandler:
         self.broker_failover_timeout = config.get("kafka_variables", {}).get("broker_failover_timeout", 30)
         self.last_broker_failure = 0
         self.broker_health = {broker: True for broker in self.brokers}
+        # The producer is only recycled after repeated failures within a window
+        self.max_broker_failures_per_window = 5
+        self.broker_failure_window = 60
+        self._windowed_broker_failures = 0
+        self._first_broker_failure_time = 0
         
         # Dual S3 redundancy settings
         self.s3_configs = self._get_s3_configs()
@@ -58,6 +64,8 @@ class KafkaHandler:
         self.s3_failover_timeout = config.get("kafka_variables", {}).get("AWS_S3", {}).get("s3_failover_timeout", 30)
         self.last_s3_failure = 0
         self.s3_health = {name: True for name in self.s3_configs.keys()}
+        self._upload_retries = config.get("kafka_variables", {}).get("AWS_S3", {}).get("upload_retries", 3)
+        self._log_topic = config.get("kafka_variables", {}).get("log_topic", "log_topic")
         
         print(f"DEBUG: Initialized with {len(self.brokers)} brokers and {len(self.s3_configs)} S3 buckets")
         
@@ -128,31 +136,15 @@ class KafkaHandler:
             prefix="clips"
         )
         
-    def _test_s3_connectivity(self, s3_name: str) -> bool:
-        """Test if an S3 bucket is reachable."""
-        try:
-            client = self.s3_clients.get(s3_name)
-            if not client:
-                return False
-            
-            config = self.s3_configs[s3_name]
-            bucket_name = config.get("BUCKET_NAME")
-            
-            # Test by listing objects (limited to 1)
-            client.list_objects_v2(Bucket=bucket_name, MaxKeys=1)
-            return True
-        except Exception:
-            return False
-            
     def _get_next_healthy_s3(self) -> Optional[str]:
         """Get the next healthy S3 bucket in round-robin fashion."""
         current_time = time.time()
         
-        # Check if enough time has passed to retry failed S3 buckets
+        # Once the failover timeout has passed, optimistically mark all S3 buckets
+        # healthy again; the next real upload reveals their true state
         if current_time - self.last_s3_failure > self.s3_failover_timeout:
             for s3_name in self.s3_configs.keys():
-                if not self.s3_health[s3_name]:
-                    self.s3_health[s3_name] = self._test_s3_connectivity(s3_name)
+                self.s3_health[s3_name] = True
         
         # Find healthy S3 buckets
         healthy_s3 = [name for name in self.s3_configs.keys() if self.s3_health[name]]
@@ -165,27 +157,15 @@ class KafkaHandler:
         self.current_s3_index += 1
         return s3_name
         
-    def _test_broker_connectivity(self, broker: str) -> bool:
-        """Test if a broker is reachable."""
-        try:
-            test_producer = KafkaProducer(
-                bootstrap_servers=str(broker),
-                request_timeout_ms=5000,
-                max_block_ms=2000
-            )
-            test_producer.close()
-            return True
-        except Exception:
-            return False
-            
     def _get_next_healthy_broker(self) -> Optional[str]:
         """Get the next healthy broker in round-robin fashion."""
         current_time = time.time()
         
+        # Passive health tracking: after the failover timeout assume every broker
+        # is healthy again and let the next real send() reveal its state
         if current_time - self.last_broker_failure > self.broker_failover_timeout:
             for broker in self.brokers:
-                if not self.broker_health[broker]:
-                    self.broker_health[broker] = self._test_broker_connectivity(broker)
+                self.broker_health[broker] = True
         
         healthy_brokers = [broker for broker in self.brokers if self.broker_health[broker]]
         
@@ -211,10 +191,13 @@ class KafkaHandler:
             
             producer = KafkaProducer(
                 bootstrap_servers=str(broker),
-                value_serializer=lambda v: json.dumps(v).encode('utf-8'),
+                value_serializer=serialize_kafka_value,
                 acks='all',
                 retries=3,
                 retry_backoff_ms=500,
+                reconnect_backoff_ms=50,
+                reconnect_backoff_max_ms=2000,
+                metadata_max_age_ms=30000,
                 compression_type='gzip',
                 batch_size=batch,
                 buffer_memory=67108864,
@@ -235,7 +218,18 @@ class KafkaHandler:
             return None
             
     def _handle_broker_failure(self):
-        """Handle broker failure and switch to next available broker."""
+        """Handle broker failure; switch to the next available broker only after repeated failures."""
+        current_time = time.time()
+        if (self._windowed_broker_failures == 0 or
+                current_time - self._first_broker_failure_time > self.broker_failure_window):
+            self._windowed_broker_failures = 0
+            self._first_broker_failure_time = current_time
+        self._windowed_broker_failures += 1
+        if self.kafka_pipeline and self._windowed_broker_failures < self.max_broker_failures_per_window:
+            # Keep the producer and let it reconnect on its own
+            return
+        self._windowed_broker_failures = 0
+
         if self.kafka_pipeline:
             try:
                 self.kafka_pipeline.close()
@@ -252,23 +246,13 @@ class KafkaHandler:
             return
             
         current_time = time.time()
-        self.messages_since_flush += 1
-        
-        # Flush if:
-        # 1. Time interval exceeded, OR
-        # 2. Message threshold reached, OR
-        # 3. This is a critical message (you can add logic here)
-        should_flush = (
-            (current_time - self.last_flush_time) >= self.flush_interval or
-            self.messages_since_flush >= self.flush_threshold
-        )
         
-        if should_flush:
+        # Flush only when the time interval is exceeded; per-message flushing
+        # would defeat the producer's batching
+        if (current_time - self.last_flush_time) >= self.flush_interval:
             try:
                 self.kafka_pipeline.flush(timeout=5)
                 self.last_flush_time = current_time
-                self.messages_since_flush = 0
-                #print(f"DEBUG: Smart flush completed - {self.messages_since_flush} messages in {current_time - self.last_flush_time:.2f}s")
             except Exception as e:
                 print(f"DEBUG: Smart flush failed: {e}")
         
@@ -278,14 +262,13 @@ class KafkaHandler:
             try:
                 self.kafka_pipeline.flush(timeout=10)
                 self.last_flush_time = time.time()
-                self.messages_since_flush = 0
                 #print("DEBUG: Force flush completed")
             except Exception as e:
                 print(f"DEBUG: Force flush failed: {e}")
-        
+
     def upload_to_s3(self, file_bytes: bytes, file_type: str = "image", retries: int = 2, delay: int = 1) -> Optional[str]:
         """Upload file bytes to S3 with dual bucket redundancy."""
-        upload_retries = self.config.get("kafka_variables", {}).get("AWS_S3", {}).get("upload_retries", 3)
+        upload_retries = self._upload_retries
         
         # Set content type and filename based on file type
         if file_type == "video":
@@ -345,7 +328,7 @@ class KafkaHandler:
                         return minio_url
                         
                 except Exception as e:
-                    print(f"DEBUG: S3 {file_type} upload attempt {attempt + 1} to {s3_name} failed: {e}")
+                    logger.warning("S3 %s upload attempt %d to %s failed: %s", file_type, attempt + 1, s3_name, e)
                     if attempt < upload_retries - 1:
                         time.sleep(delay)
             
@@ -369,11 +352,11 @@ class KafkaHandler:
         """Upload video to S3."""
         return ("video", self.upload_to_s3(video_bytes, "video") if video_bytes else None)
     
-    def process_events_queue(self, events_queue: queue.Queue, topic: str) -> bool:
+    def process_events_queue(self, events_queue: queue.Queue, topic: str, timeout: float = 0.5) -> bool:
         #print("DEBUG","Running the Process Events Queue")
         """Process events from queue and send to Kafka with dual broker and S3 redundancy."""
         try:
-            message = events_queue.get(timeout=1)  # waits up to 1 seconds
+            message = events_queue.get(timeout=timeout)  # parks until data arrives or timeout
             if message is None or topic == "None":
                 return True
                 
@@ -441,35 +424,47 @@ class KafkaHandler:
         except queue.Empty:
             return True
         except Exception as e:
-            print(f"DEBUG: Events queue processing error: {e}")
+            logger.error("Events queue processing error: %s", e)
             return False
             
-    def process_analytics_queue(self, analytics_queue: queue.Queue, topic: str) -> bool:
-        """Process analytics from queue and send to Kafka with dual broker redundancy."""
+    def process_analytics_queue(self, analytics_queue: queue.Queue, topic: str, timeout: float = 0.5) -> bool:
+        """
+        Process a batch of analytics from queue and send to Kafka with dual broker redundancy.
+
+        Not called at present: run_kafka_loop only registers the events queue.
+        """
         try:
-            message = analytics_queue.get_nowait()
-            if message is None or topic == "None":
+            # Block for the first message, then drain whatever else is already queued
+            messages = [analytics_queue.get(timeout=timeout)]
+            while len(messages) < self.send_batch_size:
+                try:
+                    messages.append(analytics_queue.get_nowait())
+                except queue.Empty:
+                    break
+            messages = [m for m in messages if m is not None]
+            if not messages or topic == "None":
                 return True
                 
             if self.kafka_pipeline:
+                sent = 0  # Messages already handed to the producer; never re-sent on retry
                 try:
-                    future = self.kafka_pipeline.send(topic, message)
-                    record_metadata = future.get(timeout=10)
+                    for message in messages:
+                        self.kafka_pipeline.send(topic, message).add_errback(log_kafka_send_failure, topic)
+                        sent += 1
                     self._smart_flush()
-                    print(f"DEBUG: Analytics message sent successfully to partition {record_metadata.partition}")
                     return True
                 except (KafkaError, NoBrokersAvailable) as e:
-                    print(f"DEBUG: Kafka analytics send failed: {e}")
+                    logger.warning("Kafka analytics send failed after %d/%d messages: %s", sent, len(messages), e)
                     self._handle_broker_failure()
                     if self.kafka_pipeline:
                         try:
-                            future = self.kafka_pipeline.send(topic, message)
-                            record_metadata = future.get(timeout=10)
+                            for message in messages[sent:]:
+                                self.kafka_pipeline.send(topic, message).add_errback(log_kafka_send_failure, topic)
                             self._smart_flush()
-                            print("DEBUG: Analytics message sent successfully after broker failover")
+                            print("DEBUG: Analytics batch sent successfully after broker failover")
                             return True
                         except Exception as retry_e:
-                            print(f"DEBUG: Analytics retry send failed: {retry_e}")
+                            logger.error("Analytics retry send failed: %s", retry_e)
                             pass
             
             return False
@@ -477,7 +472,7 @@ class KafkaHandler:
         except queue.Empty:
             return True
         except Exception as e:
-            print(f"DEBUG: Analytics queue processing error: {e}")
+            logger.error("Analytics queue processing error: %s", e)
             return False
             
     def send_error_log(self, error_message: str, error_details: str = None, sensor_id: str = None):
@@ -492,7 +487,7 @@ class KafkaHandler:
                 return
                 
             log_message = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp_ns": time.time_ns(),  # Epoch ns; consumers format as needed
                 "level": "ERROR",
                 "message": error_message,
                 "sensor_id": sensor_id,
@@ -500,16 +495,17 @@ class KafkaHandler:
                 "rate_limited": True
             }
             
-            log_topic = self.config.get("kafka_variables", {}).get("log_topic", "log_topic")
+            log_topic = self._log_topic
             
             try:
-                self.kafka_pipeline.send(log_topic, log_message)
+                # Error logs are rare and critical: wait for delivery
+                self.kafka_pipeline.send(log_topic, log_message).get(timeout=2)
                 self.last_error_time = current_time
             except (KafkaError, NoBrokersAvailable):
                 self._handle_broker_failure()
                 if self.kafka_pipeline:
                     try:
-                        self.kafka_pipeline.send(log_topic, log_message)
+                        self.kafka_pipeline.send(log_topic, log_message).get(timeout=2)
                         self.last_error_time = current_time
                     except:
                         pass
@@ -523,12 +519,12 @@ class KafkaHandler:
         send_events_pipeline = kafka_config.get("send_events_pipeline")
         send_analytics_pipeline = kafka_config.get("send_analytics_pipeline")
         
+        # Only events are published; analytics_queue is accepted for signature
+        # compatibility but not registered, so process_analytics_queue stays dormant
         queues_and_topics = [
             (events_queue, send_events_pipeline)
         ]
         
-        consecutive_empty_cycles = 0
-        
         print(f"DEBUG: Starting Kafka loop with dual brokers: {self.brokers}")
         print(f"DEBUG: S3 buckets: {[config.get('BUCKET_NAME') for config in self.s3_configs.values()]}")
         
@@ -543,22 +539,13 @@ class KafkaHandler:
                         continue
                     time.sleep(5)
                 
-                messages_processed = 0
+                # Each process_* call blocks in queue.get() until data arrives,
+                # so there is no idle back-off sleep here.
                 for queue_obj, topic in queues_and_topics:
                     if topic == send_events_pipeline:
-                        if self.process_events_queue(queue_obj, topic):
-                            messages_processed += 1
+                        self.process_events_queue(queue_obj, topic)
                     else:
-                        if self.process_analytics_queue(queue_obj, topic):
-                            messages_processed += 1
-                
-                if messages_processed == 0:
-                    consecutive_empty_cycles += 1
-                    sleep_time = min(2 * consecutive_empty_cycles, 10)
-                    time.sleep(sleep_time)
-                else:
-                    consecutive_empty_cycles = 0
-                    time.sleep(0.1)
+                        self.process_analytics_queue(queue_obj, topic)
                     
             except (KafkaError, NoBrokersAvailable) as e:
                 print(f"DEBUG: Kafka connection error: {e}")
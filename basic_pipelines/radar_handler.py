@@ -1,13 +1,45 @@
+import logging
+import selectors
 import serial
+import struct
 import time
 from collections import deque
 from threading import Thread, Lock
 from typing import Optional, Dict, Any, List, Tuple
 
+# Optional Numba-compiled scanner for bulk reads; falls back to the Python frame parser
+try:
+    from _scan_frames import scan_buffer, KIND_PRIMARY, KIND_LEADING
+except ImportError:
+    scan_buffer = None
+
+logger = logging.getLogger(__name__)
+
+# Frame headers: primary target (0xFC 0xFA ss 0x00) and leading target (0xFB 0xFD ss 0x00)
+_PRIMARY_SIG = b'\xFC\xFA'
+_LEADING_SIG = b'\xFB\xFD'
+
+# Header -> (direction, type, min speed, max speed, skip out-of-range frames);
+# an out-of-range primary target still reports, with speed 0
+_DISPATCH = {
+    _PRIMARY_SIG: ('Approaching', 'Primary Target', 0x14, 0xFA, False),
+    _LEADING_SIG: ('Receding', 'Leading Target', 0x00, 0xFA, True),
+}
+# Same table keyed on the header as a big-endian 16-bit word, for the unpacked-frame walk
+_DISPATCH_WORD = {int.from_bytes(sig, 'big'): info for sig, info in _DISPATCH.items()}
+# Unpack four frame bytes as C ints in one call
+_U4 = struct.Struct('<BBBB').unpack_from
+if scan_buffer is not None:
+    _KIND_INFO = {KIND_PRIMARY: _DISPATCH[_PRIMARY_SIG], KIND_LEADING: _DISPATCH[_LEADING_SIG]}
+
 
 class RadarHandler:
     """Handles radar communication and speed data processing."""
     
+    RANK_CAPACITY = 64  # Upper bound on rank1 readings kept within max_age
+    BULK_SCAN_BYTES = 16  # Buffered bytes at which the compiled scanner takes over (if available)
+    RX_BUF_LIMIT = 4096  # Past this the rx buffer is a stale backlog or noise; keep only the tail
+    
     def __init__(self):
         """Initialize radar handler."""
         self.radar_port = None  # Serial port for radar
@@ -18,15 +50,24 @@ class RadarHandler:
         self.count_radar = 0  # Count radar until it will become 0 again
         self.LTRC=None
         # Use deques for better performance with time-series data
+        # Fixed-capacity rings: appends past capacity drop the oldest reading in C
         # self.rank1_radar_speeds = deque()
-        self.rank2_radar_speeds = deque()
+        self.rank2_radar_speeds = deque(maxlen=1)
         self.rank3_radar_speeds = deque()
-        self.rankl_radar_speeds = deque()
+        self.rankl_radar_speeds = deque(maxlen=self.RANK_CAPACITY)
         self.latest_radar_speed = deque(maxlen=1)
+        # Match order built once: rank1, rank3, rank2 (the deques are mutated in place, never rebound)
+        self._ranks_ordered = ((self.rankl_radar_speeds,), (self.rank3_radar_speeds,), (self.rank2_radar_speeds,))
+        self._rank1_and_latest = (self.rankl_radar_speeds, self.latest_radar_speed)
         self.flag=0
         self.abnormal_count=0
         self.normal_status=True
         self.ser = None
+        self.error_logger = None  # Set via set_error_logger
+        self._bulk_scan = False  # Compiled scanner available and warmed (see _warm_bulk_scanner)
+        self._rx_buf = bytearray()  # Persistent serial receive buffer, parsed frame by frame
+        self._selector = None  # Waits on the serial fd so the read thread sleeps in the kernel
+        self.read_wait_timeout = 1.0  # Max seconds to block waiting for radar bytes
         self.is_calibrating = {}
         self.calibration_required={}
         
@@ -52,10 +93,12 @@ class RadarHandler:
         self.radar_port = port
         self.radar_baudrate = baudrate
         self.max_age = max_age
+        self._max_age_ns = int(max_age * 1e9)  # Rank timestamps are time.monotonic_ns() integers
         self.max_diff_rais = max_diff_rais
         self.calibration_required = calibration_required
         self.class_calibration_count = {}  # Track calibration count per class
         self.ser = None
+        self._warm_bulk_scanner()
         self._connect()
         
     def start_radar(self):
@@ -88,6 +131,10 @@ class RadarHandler:
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE
             )
+            # Discard whatever the OS buffered before we attached; frames are streamed from here on
+            self.ser.reset_input_buffer()
+            self._rx_buf.clear()
+            self._register_selector()
             self.is_connected = True
             self.reconnect_attempts = 0
             print(f"Radar connected successfully to {self.radar_port}")
@@ -96,10 +143,23 @@ class RadarHandler:
             self.is_connected = False
             error_msg = f"Failed to connect to radar at {self.radar_port}: {e}"
             print(error_msg)
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(error_msg)
             return False
     
+    def _register_selector(self) -> None:
+        """(Re)register the current serial fd with a selector for blocking readiness waits."""
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        try:
+            selector = selectors.DefaultSelector()
+            selector.register(self.ser.fileno(), selectors.EVENT_READ)
+            self._selector = selector
+        except (AttributeError, OSError, ValueError):
+            # Port has no pollable fd (e.g. on Windows); fall back to timed reads
+            self._selector = None
+    
     def _check_connectivity(self) -> bool:
         """Check if radar is still connected and responding."""
         if not self.ser or not self.ser.is_open:
@@ -115,7 +175,7 @@ class RadarHandler:
         """Attempt to reconnect to radar."""
         if self.reconnect_attempts >= self.max_reconnect_attempts:
             error_msg = f"Max reconnection attempts ({self.max_reconnect_attempts}) reached for radar"
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(error_msg)
             return False
         
@@ -170,59 +230,60 @@ class RadarHandler:
             return None
             
         try:
-            # Convert bytes to list of hex strings for debugging
-            hex_data = [hex(x) for x in data]
-            # Debug data removed - can be added back if needed
-            
-            # Process each 4-byte chunk
+            # Single forward walk; the first valid frame of either kind wins
             for i in range(len(data) - 3):
-                # Check for target speed pattern: 0xFC 0xFA sum 0x00
-                if data[i] == 0xFC and data[i+1] == 0xFA and data[i+3] == 0x00:
-                    speed_raw = data[i+2]
-                    if 0x14 <= speed_raw <= 0xFA:  # Valid speed range
-                        speed_kmh = speed_raw
-                        direction = 'Approaching'
-                        return {
-                            'speed': speed_kmh,
-                            'direction': direction,
-                            'type': 'Primary Target'
-                        }
-                    else:
-                        speed_kmh = 0
-                        direction = 'Approaching'
-                        return {
-                            'speed': speed_kmh,
-                            'direction': direction,
-                            'type': 'Primary Target'
-                        }
-                
-                # Check for leading target speed pattern: 0xFB 0xFD sum 0x00
-                elif data[i] == 0xFB and data[i+1] == 0xFD and data[i+3] == 0x00:
-                    speed_raw = data[i+2]
-                    if 0x00 <= speed_raw <= 0xFA:  # Valid speed range
-                        speed_kmh = speed_raw
-                        direction = 'Receding'
-                        
-                        return {
-                            'speed': speed_kmh,
-                            'direction': direction,
-                            'type': 'Leading Target'
-                        }
-            
-            return {
-                            'speed': 0,
-                            'direction': 'Approaching',
-                            'type': 'Leading Target'
-                        }
+                b0, b1, speed_raw, b3 = _U4(data, i)
+                if b3 != 0x00:
+                    continue
+                info = _DISPATCH_WORD.get((b0 << 8) | b1)
+                if info is None:
+                    continue
+                reading = self._reading_from(info, speed_raw)
+                if reading is not None:
+                    return reading
+
+            return self._no_target_reading()
         except Exception as e:
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(f"Error processing speed data: {e}")
             return None
 
+    @staticmethod
+    def _reading_from(info: Tuple, speed_raw: int) -> Optional[Dict[str, Any]]:
+        """Build a reading from a _DISPATCH entry, or None if the frame should be skipped."""
+        direction, target_type, lo, hi, skip_invalid = info
+        if lo <= speed_raw <= hi:
+            return {'speed': speed_raw, 'direction': direction, 'type': target_type}
+        if not skip_invalid:
+            return {'speed': 0, 'direction': direction, 'type': target_type}
+        return None
+
+    @staticmethod
+    def _no_target_reading() -> Dict[str, Any]:
+        """Reading reported for a frame that carries no valid target."""
+        return {
+                    'speed': 0,
+                    'direction': 'Approaching',
+                    'type': 'Leading Target'
+                }
+
     def get_speed(self) -> Optional[Dict[str, Any]]:
         """
         Get current speed reading from radar.
         Fully fault-tolerant: auto-reconnects if disconnected.
+
+        Returns:
+            The most recent decoded reading, or None if no complete frame arrived
+        """
+        readings = self._pump_frames()
+        return readings[-1] if readings else None
+
+    def _pump_frames(self) -> List[Dict[str, Any]]:
+        """
+        Read everything waiting on the serial port and decode every complete frame.
+
+        Returns:
+            Decoded readings in arrival order (empty if nothing complete arrived)
         """
         # Ensure serial connection exists
         if not self._check_connectivity():
@@ -230,93 +291,178 @@ class RadarHandler:
             self.ser = None
             self._attempt_reconnection()
             if not self.is_connected:
-                return None
+                return []
 
         if not self.ser or not self.ser.is_open:
-            return None
+            return []
 
         try:
-            data = self.ser.read(4)  # read 4 bytes
-            if len(data) == 4:
+            # Sleep in the kernel until the port is readable instead of polling
+            if len(self._rx_buf) < 4 and not self.ser.in_waiting and self._selector is not None:
+                if not self._selector.select(timeout=self.read_wait_timeout):
+                    return []
+            # Stream whatever is waiting (blocks up to the port timeout for one byte)
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if chunk:
                 self.last_successful_read = time.time()
-                return self._process_speed_data(data)
-        except serial.SerialException as e:
-            if hasattr(self, 'error_logger') and self.error_logger:
+                # Partial-frame bytes from the previous read stay at the front of the buffer
+                self._rx_buf.extend(chunk)
+                if len(self._rx_buf) > self.RX_BUF_LIMIT:
+                    del self._rx_buf[:-4]
+        except (serial.SerialException, OSError) as e:
+            # in_waiting and the selector wait are raw ioctl/poll calls: an unplugged
+            # USB adapter surfaces as a bare OSError (EIO) rather than SerialException
+            if self.error_logger is not None:
                 self.error_logger(f"Radar read error: {e}")
             self.is_connected = False
             self.ser = None  # force reconnection
+
+        if self._bulk_scan and len(self._rx_buf) >= self.BULK_SCAN_BYTES:
+            return self._scan_bulk()
+
+        readings = []
+        frame = self._next_frame()
+        while frame is not None:
+            speed_data = self._process_speed_data(frame)
+            if speed_data is not None:
+                readings.append(speed_data)
+            frame = self._next_frame()
+        return readings
+
+    def _warm_bulk_scanner(self) -> None:
+        """JIT-compile the bulk scanner now so the radar thread never stalls on the first burst."""
+        if scan_buffer is None or self._bulk_scan:
+            return
+        try:
+            scan_buffer(bytearray(self.BULK_SCAN_BYTES))
+            self._bulk_scan = True
+        except Exception as e:
+            # Compilation failed; stay on the Python frame parser
+            print(f"Radar bulk scanner unavailable, using Python parser: {e}")
+
+    def _scan_bulk(self) -> List[Dict[str, Any]]:
+        """
+        Decode every complete frame in the rx buffer with the compiled scanner.
+
+        Yields the same readings as repeated _next_frame/_process_speed_data calls.
+        """
+        try:
+            speeds, kinds, consumed = scan_buffer(self._rx_buf)
+        except Exception as e:
+            if self.error_logger is not None:
+                self.error_logger(f"Error processing speed data: {e}")
+            self._rx_buf.clear()
+            return []
+        del self._rx_buf[:consumed]
+        return [self._reading_from(_KIND_INFO[kind], speed_raw) or self._no_target_reading()
+                for speed_raw, kind in zip(speeds, kinds)]
+
+    def _next_frame(self) -> Optional[bytes]:
+        """
+        Pop the next 4-byte frame (0xFC 0xFA ss 0x00 / 0xFB 0xFD ss 0x00) from the rx buffer.
+
+        Bytes before a header are discarded; a header without the trailing 0x00
+        is treated as desync and skipped one byte at a time.
+
+        Returns:
+            The raw 4-byte frame, or None if no complete frame is buffered yet
+        """
+        buf = self._rx_buf
+        while len(buf) >= 4:
+            i = buf.find(_PRIMARY_SIG)
+            j = buf.find(_LEADING_SIG)
+            start = min(i, j) if i >= 0 and j >= 0 else max(i, j)
+            if start < 0:
+                # Keep the last byte: it may be the first half of a header
+                del buf[:-1]
+                return None
+            if start:
+                del buf[:start]
+                continue
+            if len(buf) < 4:
+                return None
+            if buf[3] == 0x00:
+                frame = bytes(buf[:4])
+                del buf[:4]
+                return frame
+            del buf[:1]
         return None
 
-    
     def _radar_read_loop(self):
         """
         Main radar reading loop running in a separate thread.
         This version is fully continuous, fault-tolerant, and avoids busy-waiting.
         """
         previous_reading = 0
-        last_connectivity_check = time.time()
+        last_connectivity_check = time.monotonic_ns()
 
         while self.radar_running:
-            current_time = time.time()
+            current_time = time.monotonic_ns()
 
             # Periodic connectivity check every 10 seconds
-            if current_time - last_connectivity_check > 10:
+            if current_time - last_connectivity_check > 10_000_000_000:
                 if not self._check_connectivity():
                     print("Radar disconnected - attempting reconnection")
                     success = self._attempt_reconnection()
                     if not success:
-                        if hasattr(self, 'error_logger') and self.error_logger:
+                        if self.error_logger is not None:
                             self.error_logger("Radar reconnection failed, will retry continuously")
                 last_connectivity_check = current_time
 
-            # Try reading radar speed
-            speed_data = self.get_speed()
-            #print(speed_data)
-            if speed_data is None:
-                time.sleep(0.05)  # small delay to prevent busy loop
+            # Decode every frame that arrived since the last pass
+            readings = self._pump_frames()
+            #logger.debug("Speed data: %s", readings)
+            if not readings:
+                # The serial read already blocks for the port timeout; only back off while disconnected
+                if not self.is_connected:
+                    time.sleep(0.05)
                 continue
 
-            speed = speed_data['speed']
-            direction = speed_data['direction']
-            target_type = speed_data['type']
-
-            # Thread-safe processing
+            # Thread-safe processing; one timestamp for the whole batch of frames
+            current_time = time.monotonic_ns()
             with self.radar_lock:
-                current_time = time.time()
-                if previous_reading != 0 and abs(speed - previous_reading) >= 4:
-                    self.count_radar = 0
-                    if self.flag == 0:
-                        self._add_speed_to_rank(previous_reading, self.rankl_radar_speeds, current_time)
-                    else:
-                        self.flag = 0
-                previous_reading = speed
-
-                if self.flag==0:
-                    self.latest_radar_speed.append((current_time, speed))
+                for speed_data in readings:
+                    speed = speed_data['speed']
+                    if previous_reading != 0 and abs(speed - previous_reading) >= 4:
+                        self.count_radar = 0
+                        if self.flag == 0:
+                            self._add_speed_to_rank(previous_reading, self.rankl_radar_speeds, current_time)
+                        else:
+                            self.flag = 0
+                    previous_reading = speed
+
+                    if self.flag==0:
+                        self.latest_radar_speed.append((current_time, speed))
                 
                 
-                if speed != 0:
-                    self.count_radar += 1
-                    # Handle rank logic
-                    if self.count_radar == 1:
-                        self._cleanup_old_speeds(self.rankl_radar_speeds, current_time)
-                    elif self.count_radar != 0:
-                        self._add_speed_to_rank(speed, self.rank3_radar_speeds, current_time)
-                        self._process_rank3_to_rank2()
-                    #print(f"DEBUG: Latest speed: {self.latest_radar_speed}, Rankl: {self.rankl_radar_speeds}")
-                    #Absnormal Check
-                    if speed > 65:
-                        self.abnormal_count+=1
-                    else:
-                        self.abnormal_count=0
+                    if speed != 0:
+                        self.count_radar += 1
+                        # Handle rank logic
+                        if self.count_radar == 1:
+                            self._cleanup_old_speeds(self.rankl_radar_speeds, current_time)
+                        elif self.count_radar != 0:
+                            self._add_speed_to_rank(speed, self.rank3_radar_speeds, current_time)
+                            self._process_rank3_to_rank2()
+                        #logger.debug("Latest speed: %s, Rankl: %s", self.latest_radar_speed, self.rankl_radar_speeds)
+                        #Absnormal Check
+                        if speed > 65:
+                            self.abnormal_count+=1
+                        else:
+                            self.abnormal_count=0
         
     def get_radar_data(self, ai_speed,threshold, obj_class):
         """
         Optimized radar speed matching with early exit and cleaner logic
         """
         with self.radar_lock:
+            # Age out stale readings from the left of each time-ordered deque (O(1) amortized)
+            current_time = time.monotonic_ns()
+            self._cleanup_old_speeds(self.rankl_radar_speeds, current_time)
+            self._cleanup_old_speeds(self.rank3_radar_speeds, current_time)
+            self._cleanup_old_speeds(self.rank2_radar_speeds, current_time)
+
             # Early exit if no radar data available
-            if not any([self.rankl_radar_speeds, self.rank2_radar_speeds, self.rank3_radar_speeds]):
+            if not (self.rankl_radar_speeds or self.rank2_radar_speeds or self.rank3_radar_speeds):
                 return None,False,self.normal_status
             elif self.abnormal_count>15:
                 self.normal_status=False
@@ -327,7 +473,7 @@ class RadarHandler:
             min_speed = threshold - 2
             
             # Process calibration mode
-            if self.is_calibrating[obj_class]:
+            if self.is_calibrating.get(obj_class, False):
                 rs,r1=self._handle_calibration_mode(ai_speed, obj_class, min_speed)
                 return rs,r1,self.normal_status
             # Normal mode: try each rank in order
@@ -338,34 +484,33 @@ class RadarHandler:
         """
         Handle calibration mode with early exit
         """
-        # Filter rank1 speeds once - more efficient with list comprehension
-        result=self.rankl_radar_speeds+self.latest_radar_speed
-        valid_speeds = [(ts, speed) for ts, speed in result if speed > min_speed] # This will filter speed of 0km/h
-        if not valid_speeds or len(valid_speeds)>1:
+        # Single pass over rank1 + latest speed; exactly one valid reading is required
+        best_match = None
+        best_source = None
+        best_idx = -1
+        for source in self._rank1_and_latest:
+            for idx, entry in enumerate(source):
+                if entry[1] > min_speed: # This will filter speed of 0km/h
+                    if best_match is not None:
+                        return None,False
+                    best_match, best_source, best_idx = entry, source, idx
+        if best_match is None:
             return None,False
         
-        # Find best match
-        best_match = min(valid_speeds, key=lambda x: abs(x[1] - ai_speed))
-        
-        # Update calibration count
-        if self.class_calibration_count[obj_class] < self.calibration_required:
-            self.class_calibration_count[obj_class] += 1
-            print(f"Calibration for {obj_class}: {self.class_calibration_count[obj_class]}/{self.calibration_required} done.")
-            if self.class_calibration_count[obj_class]>=self.calibration_required:
-                self.stop_calbirating(obj_class)
+        # Update calibration count (single lookup; stop once the required count is reached)
+        cnt = self.class_calibration_count.get(obj_class, 0) + 1
+        if cnt <= self.calibration_required:
+            self.class_calibration_count[obj_class] = cnt
+            print(f"Calibration for {obj_class}: {cnt}/{self.calibration_required} done.")
+        if cnt >= self.calibration_required:
+            self.is_calibrating[obj_class] = False
             
         
-        # Remove used speed from the correct deque
-        try:
-            if best_match in self.rankl_radar_speeds:
-                self.rankl_radar_speeds.remove(best_match)
-            elif best_match in self.latest_radar_speed:
-                self.latest_radar_speed.remove(best_match)
-                #print("calibration done with latest Speed")
-                self.flag=1
-        except ValueError:
-            # If best_match is not found in either deque, continue without error
-            pass
+        # Remove used speed by position (no second equality scan)
+        del best_source[best_idx]
+        if best_source is self.latest_radar_speed:
+            #print("calibration done with latest Speed")
+            self.flag=1
         self.LTRC=best_match[0]
         return best_match[1],True
 
@@ -373,74 +518,75 @@ class RadarHandler:
         """
         Get best match from available ranks with early exit
         """
-        # Define ranks to check in order of priority
-        rank_configs = [
-            [self.rankl_radar_speeds, 'rank1'],
-            [self.rank3_radar_speeds, 'rank3'], 
-            [self.rank2_radar_speeds, 'rank2']
-        ]
+        # Ranks are checked in order of priority
         rank1=False
-        for radar_speeds, rank_name in rank_configs:
-            # Filter speeds above threshold - more efficient with list comprehension
-             # For latest Speed
-            if rank_name == "rank1":
-                if self.latest_radar_speed and int(self.latest_radar_speed[0][1]) != 0:
-                    result = radar_speeds + self.latest_radar_speed
-                else:
-                    result = radar_speeds
- 
-
-                #print("Result fron rankl Best Match",result)
-                valid_speeds = [(ts, speed) for ts, speed in result if speed > 15]
-            else:
-                valid_speeds = [(ts, speed) for ts, speed in radar_speeds if abs(speed-ai_speed) < self.max_diff_rais and speed > min_speed]
-            # print(radar_speeds,rank_name)
-            if valid_speeds:
-                # Get earliest timestamp (best match)
-                best_match = min(valid_speeds, key=lambda x: abs(x[1] - ai_speed))
-                
-                if len(valid_speeds)==1 and rank_name == "rank1" and valid_speeds[0][0]>self.LTRC:
+        for rank_idx, sources in enumerate(self._ranks_ordered):
+            is_rank1 = rank_idx == 0
+            # For latest Speed
+            if is_rank1 and self.latest_radar_speed and int(self.latest_radar_speed[0][1]) != 0:
+                sources = self._rank1_and_latest
+
+            # Single pass: filter, count and pick the closest speed without building lists
+            best_match = None
+            best_source = None
+            best_idx = -1
+            best_diff = None
+            first_valid = None
+            valid_count = 0
+            for source in sources:
+                for idx, entry in enumerate(source):
+                    speed = entry[1]
+                    if is_rank1:
+                        if speed <= 15:
+                            continue
+                    elif not (abs(speed-ai_speed) < self.max_diff_rais and speed > min_speed):
+                        continue
+                    valid_count += 1
+                    if first_valid is None:
+                        first_valid = entry
+                    diff = abs(speed - ai_speed)
+                    if best_diff is None or diff < best_diff:
+                        best_match, best_source, best_idx, best_diff = entry, source, idx, diff
+
+            if best_match is not None:
+                if valid_count==1 and is_rank1 and first_valid[0]>self.LTRC:
                   rank1=True
                   
-				# Remove used speed
-                try:
-                    if best_match in radar_speeds:
-                        #print("speed is from Rankl")
-                        radar_speeds.remove(best_match)
-                    elif best_match in self.latest_radar_speed:
-                        #print("speed is from Latest")
-                        self.latest_radar_speed.remove(best_match)
-                        self.flag=1
-                except ValueError:
-                    # If best_match is not found in either deque, continue without error
-                    pass
+                # Remove used speed by position (no second equality scan)
+                del best_source[best_idx]
+                if best_source is self.latest_radar_speed:
+                    #print("speed is from Latest")
+                    self.flag=1
                 self.LTRC=best_match[0]
                 return best_match[1],rank1
         
         # No valid speeds found in any rank
         return None,rank1
         
-    def _cleanup_old_speeds(self, speed_deque: deque, current_time: float) -> None:
+    def _cleanup_old_speeds(self, speed_deque: deque, current_time: int) -> None:
         """
         Remove old speed entries from a deque based on max_age.
         
         Args:
-            speed_deque: Deque containing (timestamp, speed) tuples
-            current_time: Current timestamp
+            speed_deque: Deque containing (monotonic_ns, speed) tuples
+            current_time: Current time.monotonic_ns() value
         """
-        while speed_deque and (current_time - speed_deque[0][0]) >= self.max_age:
+        while speed_deque and (current_time - speed_deque[0][0]) >= self._max_age_ns:
             speed_deque.popleft()
     
-    def _add_speed_to_rank(self, speed: int, rank_deque: deque, current_time: float) -> None:
+    def _add_speed_to_rank(self, speed: int, rank_deque: deque, current_time: int) -> None:
         """
         Add speed to a rank deque with cleanup.
         
         Args:
             speed: Speed value to add
             rank_deque: Target deque to add to
-            current_time: Current timestamp
+            current_time: Current time.monotonic_ns() value
         """
-        self._cleanup_old_speeds(rank_deque, current_time)
+        # Same ageing as _cleanup_old_speeds, inlined: called for every rank write
+        max_age_ns = self._max_age_ns
+        while rank_deque and (current_time - rank_deque[0][0]) >= max_age_ns:
+            rank_deque.popleft()
         rank_deque.append((current_time, speed))
     
     def _process_rank3_to_rank2(self) -> None:
@@ -448,10 +594,5 @@ class RadarHandler:
         Process rank2 speeds and move oldest to rank2 when rank3 has 2 entries.
         """
         if len(self.rank3_radar_speeds) >= 2:
-            # Move oldest speed from rank3 to rank2
-            oldest_speed = self.rank3_radar_speeds.popleft()
-            self.rank2_radar_speeds.append(oldest_speed)
-            
-            # Keep only the most recent entry in rank3
-            if len(self.rank2_radar_speeds) > 1:
-                self.rank2_radar_speeds.popleft()
+            # Move oldest speed from rank3 to rank2 (maxlen=1 evicts the previous entry)
+            self.rank2_radar_speeds.append(self.rank3_radar_speeds.popleft())
@@ -1,9 +1,16 @@
+import logging
 import serial
 import time
 from collections import deque
 from threading import Thread, Lock
 from typing import Optional, Dict, Any, List, Tuple
 
+logger = logging.getLogger(__name__)
+
+# Frame headers: primary target (0xFC 0xFA ss 0x00) and leading target (0xFB 0xFD ss 0x00)
+_PRIMARY_SIG = b'\xFC\xFA'
+_LEADING_SIG = b'\xFB\xFD'
+
 
 class RadarHandler:
     """Handles radar communication and speed data processing."""
@@ -24,6 +31,7 @@ class RadarHandler:
         self.latest_radar_speed = deque(maxlen=1)
         self.flag=0
         self.ser = None
+        self.error_logger = None  # Set via set_error_logger
         self.is_calibrating = {}
         self.lr1t=time.time()
         
@@ -93,7 +101,7 @@ class RadarHandler:
             self.is_connected = False
             error_msg = f"Failed to connect to radar at {self.radar_port}: {e}"
             print(error_msg)
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(error_msg)
             return False
     
@@ -112,7 +120,7 @@ class RadarHandler:
         """Attempt to reconnect to radar."""
         if self.reconnect_attempts >= self.max_reconnect_attempts:
             error_msg = f"Max reconnection attempts ({self.max_reconnect_attempts}) reached for radar"
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(error_msg)
             return False
         
@@ -167,40 +175,35 @@ class RadarHandler:
             return None
             
         try:
-            # Convert bytes to list of hex strings for debugging
-            hex_data = [hex(x) for x in data]
-            # Debug data removed - can be added back if needed
-            
-            # Process each 4-byte chunk
-            for i in range(len(data) - 3):
-                # Check for target speed pattern: 0xFC 0xFA sum 0x00
-                if data[i] == 0xFC and data[i+1] == 0xFA and data[i+3] == 0x00:
-                    speed_raw = data[i+2]
-                    if 0x0F <= speed_raw <= 0xFA:  # Valid speed range
-                        speed_kmh = speed_raw
-                        direction = 'Approaching'
-                        return {
-                            'speed': speed_kmh,
-                            'direction': direction,
-                            'type': 'Primary Target'
-                        }
-                
-                # Check for leading target speed pattern: 0xFB 0xFD sum 0x00
-                elif data[i] == 0xFB and data[i+1] == 0xFD and data[i+3] == 0x00:
-                    speed_raw = data[i+2]
-                    if 0x00 <= speed_raw <= 0xFA:  # Valid speed range
-                        speed_kmh = speed_raw
-                        direction = 'Receding'
-                        
-                        return {
-                            'speed': speed_kmh,
-                            'direction': direction,
-                            'type': 'Leading Target'
-                        }
+            n = len(data)
+
+            # Locate the first valid target speed pattern: 0xFC 0xFA sum 0x00
+            i = data.find(_PRIMARY_SIG)
+            while i >= 0 and (i + 3 >= n or data[i+3] != 0x00 or not 0x0F <= data[i+2] <= 0xFA):
+                i = data.find(_PRIMARY_SIG, i + 1)
+
+            # Locate the first valid leading target speed pattern: 0xFB 0xFD sum 0x00
+            j = data.find(_LEADING_SIG)
+            while j >= 0 and (j + 3 >= n or data[j+3] != 0x00 or data[j+2] > 0xFA):
+                j = data.find(_LEADING_SIG, j + 1)
+
+            # Whichever pattern appears first in the stream wins
+            if i >= 0 and (j < 0 or i < j):
+                return {
+                    'speed': data[i+2],
+                    'direction': 'Approaching',
+                    'type': 'Primary Target'
+                }
+            if j >= 0:
+                return {
+                    'speed': data[j+2],
+                    'direction': 'Receding',
+                    'type': 'Leading Target'
+                }
             
             return None
         except Exception as e:
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(f"Error processing speed data: {e}")
             return None
 
@@ -228,7 +231,7 @@ class RadarHandler:
                 self.last_successful_read = time.time()
                 return self._process_speed_data(data)
         except Exception as e:
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(f"Radar read error: {e}")
             self.is_connected = False
             self.ser = None  # Force reconnection on next attempt
@@ -257,54 +260,54 @@ class RadarHandler:
                         direction = speed_data['direction']
                         target_type = speed_data['type']   
                         
-                        # Parse the radar data with thread safety
-                        try:
+                        # Parse the radar data under radar_lock; get_radar_data reads and edits the same deques
+                        with self.radar_lock:
+                            try:
                             
-                            # Reset counter if speed difference is too large
-                            if previous_reading !=0 and abs(speed - previous_reading) > 4:
-                                self.count_radar = 0
-                                if self.flag==0:
-                                    self._add_speed_to_rank(previous_reading, self.rankl_radar_speeds, current_time)
-                                else:
-                                    self.flag=0
-                            previous_reading = speed
-                            self.latest_radar_speed.append((time.time(),speed))
-                            if speed != 0:
-                                self.count_radar += 1
-                                current_time = time.time()
+                                # Reset counter if speed difference is too large
+                                if previous_reading !=0 and abs(speed - previous_reading) > 4:
+                                    self.count_radar = 0
+                                    if self.flag==0:
+                                        self._add_speed_to_rank(previous_reading, self.rankl_radar_speeds, current_time)
+                                    else:
+                                        self.flag=0
+                                previous_reading = speed
+                                self.latest_radar_speed.append((time.time(),speed))
+                                if speed != 0:
+                                    self.count_radar += 1
+                                    current_time = time.time()
                                 
-                                # Process based on count
-                                if self.count_radar == 1:
-                                    # First reading goes to rank1
-                                    # self._add_speed_to_rank(speed, self.rank1_radar_speeds, current_time)
-                                    self._cleanup_old_speeds(self.rankl_radar_speeds, current_time)
+                                    # Process based on count
+                                    if self.count_radar == 1:
+                                        # First reading goes to rank1
+                                        # self._add_speed_to_rank(speed, self.rank1_radar_speeds, current_time)
+                                        self._cleanup_old_speeds(self.rankl_radar_speeds, current_time)
                                     
-                                elif self.count_radar != 0:
-                                    # Even readings go to rank2
-                                    self._add_speed_to_rank(speed, self.rank3_radar_speeds, current_time)
-                                    # Process rank2 to rank3 transfer
-                                    self._process_rank3_to_rank2()
-                                    # print(f"Rank1 speeds: {list(self.rank1_radar_speeds)}")
-                                    # print(f"Rank2 speeds: {list(self.rank2_radar_speeds)}")
-                                    # print(f"Rank3 speeds: {list(self.rank3_radar_speeds)}")
-                                    # print(f"Rankl speeds: {list(self.rankl_radar_speeds)}")
-                                    # print(f"Latest Speed: {list(self.latest_radar_speed)}")
+                                    elif self.count_radar != 0:
+                                        # Even readings go to rank2
+                                        self._add_speed_to_rank(speed, self.rank3_radar_speeds, current_time)
+                                        # Process rank2 to rank3 transfer
+                                        self._process_rank3_to_rank2()
+                                        # Deques are passed as-is; repr only runs when DEBUG is enabled
+                                        logger.debug("Rankl speeds: %s, Rank2 speeds: %s, Rank3 speeds: %s, Latest Speed: %s",
+                                                     self.rankl_radar_speeds, self.rank2_radar_speeds,
+                                                     self.rank3_radar_speeds, self.latest_radar_speed)
                                 
-                                print(f"Actual Radar Running Speed: {speed}, Count: {self.count_radar}")
-                            else:
-                                self.count_radar = 0
-                        except (ValueError, IndexError) as e:
-                            if hasattr(self, 'error_logger') and self.error_logger:
-                                self.error_logger(f"Error parsing radar data: {e}")
-                            continue
+                                    logger.debug("Actual Radar Running Speed: %s, Count: %s", speed, self.count_radar)
+                                else:
+                                    self.count_radar = 0
+                            except (ValueError, IndexError) as e:
+                                if self.error_logger is not None:
+                                    self.error_logger(f"Error parsing radar data: {e}")
+                                continue
                             
                 except serial.SerialException as e:
-                    if hasattr(self, 'error_logger') and self.error_logger:
+                    if self.error_logger is not None:
                         self.error_logger(f"Serial communication error: {e}")
                     break
                         
         except serial.SerialException as e:
-            if hasattr(self, 'error_logger') and self.error_logger:
+            if self.error_logger is not None:
                 self.error_logger(f"Failed to open radar serial port: {e}")
         
     def get_radar_data(self, ai_speed,threshold, obj_class):
@@ -314,14 +317,14 @@ class RadarHandler:
         with self.radar_lock:
             current_counter=self.count_radar
             # Early exit if no radar data available
-            if not any([self.rankl_radar_speeds, self.rank2_radar_speeds, self.rank3_radar_speeds]):
+            if not (self.rankl_radar_speeds or self.rank2_radar_speeds or self.rank3_radar_speeds):
                 return None,False,current_counter
             
             # Filter speeds above threshold once
             min_speed = threshold - 2
             
             # Process calibration mode
-            if self.is_calibrating[obj_class]:
+            if self.is_calibrating.get(obj_class, False):
                 rs,r1=self._handle_calibration_mode(ai_speed, obj_class, min_speed)
                 return rs,r1,current_counter
             # Normal mode: try each rank in order
@@ -341,12 +344,13 @@ class RadarHandler:
         # Find best match
         best_match = min(valid_speeds, key=lambda x: abs(x[1] - ai_speed))
         
-        # Update calibration count
-        if self.class_calibration_count[obj_class] < self.calibration_required:
-            self.class_calibration_count[obj_class] += 1
-            print(f"Calibration for {obj_class}: {self.class_calibration_count[obj_class]}/{self.calibration_required} done.")
+        # Update calibration count (single lookup)
+        cnt = self.class_calibration_count.get(obj_class, 0)
+        if cnt < self.calibration_required:
+            self.class_calibration_count[obj_class] = cnt + 1
+            print(f"Calibration for {obj_class}: {cnt + 1}/{self.calibration_required} done.")
         else:
-            self.stop_calbirating(obj_class)
+            self.is_calibrating[obj_class] = False
             
         
         # Remove used speed from the correct deque
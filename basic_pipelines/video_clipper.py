@@ -1,13 +1,26 @@
 import os
-import uuid
 import cv2
 import numpy as np
 from datetime import datetime
-from collections import deque
-from pathlib import Path
+from threading import Lock, Thread
 import io
+import queue
 import av
-import gc
+
+# H.264 encoders in order of preference: V4L2 M2M hardware block, then software x264
+H264_ENCODERS = ('h264_v4l2m2m', 'libx264')
+SOFTWARE_ENCODER = 'libx264'
+
+
+def select_h264_encoder() -> str:
+    """Return the first H.264 encoder from H264_ENCODERS that this FFmpeg build provides."""
+    for name in H264_ENCODERS:
+        try:
+            av.codec.Codec(name, 'w')
+            return name
+        except Exception:
+            continue
+    return SOFTWARE_ENCODER
 
 
 class VideoClipRecorder:
@@ -21,47 +34,197 @@ class VideoClipRecorder:
             prefix: Prefix for video filenames (used by external upload handlers)
         """
         self.prefix = prefix
-        self.frame_buffer = deque(maxlen=maxlen)
+        self.maxlen = maxlen
+        # Preallocated circular buffer of frames, allocated once the frame shape is known
+        self._frames = None
+        self._head = 0  # Slot the next frame is written to
+        self._count = 0  # Number of valid frames in the ring
+        self._lock = Lock()
+        # Staging buffer the ring is snapshotted into for encoding, reused across clips
+        # (stays resident once allocated: steady-state frame memory is 2x the ring)
+        self._encode_stage = None
+        self._stage_lock = Lock()
         self.fps = fps
+        self.codec_name = select_h264_encoder()  # Cached; drops to software if the device fails to open
+        # Encoder session opened ahead of the next clip: (key, (buf, container, stream))
+        self._spare_session = None
+        self._spare_lock = Lock()
+        # Frames handed over by the pipeline thread; the worker copies them into the ring
+        self._in_q = queue.Queue(maxsize=4)
+        self._worker = Thread(target=self._drain, daemon=True)
+        self._worker.start()
         
-        print(f"Initiated VideoClipRecorder with buffer size {maxlen}")
+        print(f"Initiated VideoClipRecorder with buffer size {maxlen} using {self.codec_name}")
 
     def add_frame(self, frame: np.ndarray):
-        """Add a frame to the RAM-backed buffer."""
+        """
+        Add a frame to the RAM-backed buffer.
+
+        Only enqueues the frame; the worker thread does the copy into the ring. When
+        the worker falls behind the oldest pending frame is dropped - for a rolling
+        clip buffer a missing frame beats stalling the pipeline thread.
+
+        Frames that own their memory (get_numpy_from_buffer returns a copy taken while
+        the GstBuffer is mapped) are queued as-is. Views over memory the caller may
+        recycle are copied here, before the call returns.
+        """
+        if not frame.flags.owndata:
+            frame = frame.copy()
+        try:
+            self._in_q.put_nowait(frame)
+        except queue.Full:
+            try:
+                self._in_q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._in_q.put_nowait(frame)
+            except queue.Full:
+                pass
+
+    def _drain(self):
+        """Worker loop: move queued frames into the ring."""
+        while True:
+            self._store_frame(self._in_q.get())
+
+    def _store_frame(self, frame: np.ndarray):
+        """Copy a frame into the next ring slot, (re)allocating the ring on shape change."""
         try:
-            self.frame_buffer.append(frame.copy())
+            reallocated = False
+            with self._lock:
+                if self._frames is None or self._frames.shape[1:] != frame.shape or self._frames.dtype != frame.dtype:
+                    # First frame or resolution change: (re)allocate the ring
+                    self._frames = np.empty((self.maxlen, *frame.shape), dtype=frame.dtype)
+                    self._head = 0
+                    self._count = 0
+                    reallocated = True
+                np.copyto(self._frames[self._head], frame)
+                self._head = (self._head + 1) % self.maxlen
+                self._count = min(self._count + 1, self.maxlen)
+            if reallocated:
+                self._warm_session_async(*frame.shape[:2])
         except Exception as e:
             print(f"[ERROR] Failed to add frame to buffer: {e}")
 
     def generate_video_bytes(self, clear_after=True) -> bytes | None:
         """
         Memory-efficient in-memory MP4 (H.264 ultrafast) encoding.
-        Takes a snapshot of the deque to avoid frame changes during encoding.
+        Takes a snapshot of the ring to avoid frame changes during encoding.
         """
-        if not self.frame_buffer:
-            return None
+        with self._lock:
+            if not self._count:
+                return None
+            # One contiguous copy of the ring in oldest-to-newest order; the worker keeps
+            # overwriting slots while we encode
+            order = (np.arange(self._count) + (self._head - self._count)) % self.maxlen
+            # Copy into the reusable stage unless another clip is still encoding from it
+            staged = self._stage_lock.acquire(blocking=False)
+            try:
+                if staged:
+                    if self._encode_stage is None or self._encode_stage.shape != self._frames.shape \
+                            or self._encode_stage.dtype != self._frames.dtype:
+                        self._encode_stage = np.empty_like(self._frames)
+                    frame_buffer_copy = self._encode_stage[:self._count]
+                    # mode='wrap' (indices are already in range): the default 'raise' buffers `out`,
+                    # allocating a full ring-sized temporary per clip
+                    np.take(self._frames, order, axis=0, out=frame_buffer_copy, mode='wrap')
+                else:
+                    frame_buffer_copy = self._frames[order]
+            except Exception as e:
+                # e.g. MemoryError allocating the stage; don't leave it locked for later clips
+                if staged:
+                    self._stage_lock.release()
+                print(f"[ERROR] Failed to generate video bytes: {e}")
+                return None
 
         try:
-            # Snapshot the current frames to avoid mid-encode changes
-            frame_buffer_copy = [frame.copy() for frame in list(self.frame_buffer)]
-            h, w, _ = frame_buffer_copy[0].shape
+            try:
+                video_bytes = self._encode_frames(frame_buffer_copy, self.codec_name)
+            except Exception as e:
+                if self.codec_name == SOFTWARE_ENCODER:
+                    raise
+                # Encoder is listed but the hardware is unusable here; stick to software from now on
+                print(f"[WARN] {self.codec_name} encode failed ({e}), falling back to {SOFTWARE_ENCODER}")
+                self.codec_name = SOFTWARE_ENCODER
+                video_bytes = self._encode_frames(frame_buffer_copy, self.codec_name)
+
+            if clear_after:
+                with self._lock:
+                    self._count = 0
+
+            # Have an opened encoder ready for the next clip
+            self._warm_session_async(*frame_buffer_copy.shape[1:3])
 
-            buf = io.BytesIO()
-            container = av.open(buf, mode='w', format='mp4')
+            return video_bytes
+
+        except Exception as e:
+            print(f"[ERROR] Failed to generate video bytes: {e}")
+            return None
+        finally:
+            del frame_buffer_copy
+            if staged:
+                self._stage_lock.release()
 
-            stream = container.add_stream('libx264', rate=self.fps)
+    def _open_session(self, h: int, w: int, codec_name: str):
+        """Create an in-memory MP4 container with an opened H.264 stream for (h, w)."""
+        buf = io.BytesIO()
+        container = av.open(buf, mode='w', format='mp4')
+        try:
+            stream = container.add_stream(codec_name, rate=self.fps)
             stream.width = w
             stream.height = h
-            stream.pix_fmt = 'yuv420p'
+            stream.pix_fmt = 'yuv420p'  # PyAV converts each frame to the encoder format
+
+            if codec_name == SOFTWARE_ENCODER:
+                stream.codec_context.options = {
+                    'preset': 'ultrafast',
+                    'tune': 'zerolatency',
+                    'profile': 'baseline',
+                }
+            # Pay the encoder start-up (SPS/PPS, rate control, lookahead) now
+            stream.codec_context.open()
+        except Exception:
+            container.close()
+            raise
+        return buf, container, stream
+
+    def _warm_session_async(self, h: int, w: int):
+        """Open the next clip's encoder session on a background thread."""
+        Thread(target=self._warm_session, args=(h, w), daemon=True).start()
+
+    def _warm_session(self, h: int, w: int):
+        """Open and park an encoder session for (h, w) unless a matching one is already parked."""
+        key = (h, w, self.fps, self.codec_name)
+        with self._spare_lock:
+            if self._spare_session is not None and self._spare_session[0] == key:
+                return
+        try:
+            session = self._open_session(h, w, self.codec_name)
+        except Exception:
+            return  # The clip path opens (and falls back) on its own
+        with self._spare_lock:
+            stale, self._spare_session = self._spare_session, (key, session)
+        if stale is not None:
+            stale[1][1].close()
+
+    def _take_session(self, h: int, w: int, codec_name: str):
+        """Return the pre-opened session if it matches (h, w, fps, codec), else open a new one."""
+        with self._spare_lock:
+            spare, self._spare_session = self._spare_session, None
+        if spare is not None:
+            key, session = spare
+            if key == (h, w, self.fps, codec_name):
+                return session
+            session[1].close()
+        return self._open_session(h, w, codec_name)
 
-            codec_ctx = stream.codec_context
-            codec_ctx.options = {
-                'preset': 'ultrafast',
-                'tune': 'zerolatency',
-                'profile': 'baseline',
-            }
+    def _encode_frames(self, frames: np.ndarray, codec_name: str) -> bytes:
+        """Encode frames (N, H, W, 3) to MP4 bytes in memory with the given H.264 encoder."""
+        h, w = frames.shape[1:3]
 
-            for frame_bgr in frame_buffer_copy:
+        buf, container, stream = self._take_session(h, w, codec_name)
+        try:
+            for frame_bgr in frames:
                 if frame_bgr.dtype != np.uint8:
                     frame_bgr = frame_bgr.astype(np.uint8)
                 if not frame_bgr.flags['C_CONTIGUOUS']:
@@ -70,31 +233,18 @@ class VideoClipRecorder:
                 #frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
                 video_frame = av.VideoFrame.from_ndarray(frame_bgr, format='rgb24')
 
-                for packet in stream.encode(video_frame):
-                    container.mux(packet)
-
-                del video_frame, packet
-
-            for packet in stream.encode():
-                container.mux(packet)
+                container.mux(stream.encode(video_frame))
+                del video_frame
 
+            # Flush delayed packets from the encoder
+            container.mux(stream.encode())
+        finally:
             container.close()
 
-            buf.seek(0)
-            video_bytes = buf.read()
-            buf.close()
-
-            if clear_after:
-                self.frame_buffer.clear()
-
-            del container, stream, codec_ctx, frame_buffer_copy
-            gc.collect()
-
-            return video_bytes
-
-        except Exception as e:
-            print(f"[ERROR] Failed to generate video bytes: {e}")
-            return None
+        # Bytes never touch disk; take the MP4 straight from the in-memory buffer
+        video_bytes = buf.getvalue()
+        buf.close()
+        return video_bytes
 
     def save_images(self, org_img, save_dir: str, suffix: str):
         """Save a decoded OpenCV image (`numpy.ndarray`, dtype uint8, BGR)."""
@@ -112,8 +262,8 @@ class VideoClipRecorder:
             if not org_img.flags['C_CONTIGUOUS']:
                 org_img = np.ascontiguousarray(org_img)
 
-            success = cv2.imwrite(org_path, org_img)
-            print("Success")
+            # libjpeg(-turbo) at q90; callers already run this on their executor thread
+            success = cv2.imwrite(org_path, org_img, [cv2.IMWRITE_JPEG_QUALITY, 90])
             if not success:
                 raise IOError(f"cv2.imwrite failed for image at {org_path}")
 